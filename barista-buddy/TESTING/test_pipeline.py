@@ -5,15 +5,53 @@ Tests each component and the full pipeline
 
 import sys
 import os
+import io
+import contextlib
+import functools
+import json
+import multiprocessing
+import random
+import tempfile
 
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from fuzzy_matcher import FuzzyMatcher
+import numpy as np
+
+from fuzzy_matcher import FuzzyMatcher, bounded_levenshtein
 from topic_filter import TopicFilter
 from retrieval_system import RetrievalSystem
 
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'DATA FILES')
+
+# Queries token_set_ratio alone used to match to an FAQ answer
+OFF_TOPIC_QUERIES = ["tell me a joke", "can you help me", "what is the weather today", "how to fix my car"]
+
+# The standalone app lives at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+# Components are built once per process and shared by every test
+@functools.lru_cache(maxsize=None)
+def _matcher():
+    return FuzzyMatcher(os.path.join(DATA_DIR, 'pronunciation_dict.json'))
+
+
+@functools.lru_cache(maxsize=None)
+def _filter():
+    return TopicFilter(os.path.join(DATA_DIR, 'coffee_keywords.txt'))
+
+
+@functools.lru_cache(maxsize=None)
+def _retrieval():
+    return RetrievalSystem(os.path.join(DATA_DIR, 'coffee_knowledge.json'))
+
+
+def _correct(matcher, text):
+    """Normalize each word of a query"""
+    return " ".join(matcher.normalize(word) for word in text.lower().split())
+
 
 class TestSuite:
     """Test suite for Barista Buddy"""
@@ -21,6 +59,7 @@ class TestSuite:
     def __init__(self):
         self.passed = 0
         self.failed = 0
+        self.skipped = 0
         self.total = 0
     
     def test(self, name: str, condition: bool, message: str = ""):
@@ -35,6 +74,12 @@ class TestSuite:
             if message:
                 print(f"    {message}")
     
+    def skip(self, name: str, reason: str):
+        """Record a test that cannot run in this environment"""
+        self.skipped += 1
+        print(f"  - {name} (skipped)")
+        print(f"    {reason}")
+    
     def section(self, name: str):
         """Print section header"""
         print(f"\n{'='*70}")
@@ -49,6 +94,8 @@ class TestSuite:
         print(f"  Total:  {self.total}")
         print(f"  Passed: {self.passed} ✓")
         print(f"  Failed: {self.failed} ✗")
+        if self.skipped:
+            print(f"  Skipped: {self.skipped}")
         print(f"  Score:  {(self.passed/self.total*100):.1f}%")
         print(f"{'='*70}\n")
 
@@ -59,7 +106,7 @@ def test_fuzzy_matcher():
     suite.section("FUZZY MATCHER TESTS")
     
     try:
-        matcher = FuzzyMatcher()
+        matcher = _matcher()
         
         # Test direct corrections
         test_cases = [
@@ -70,7 +117,7 @@ def test_fuzzy_matcher():
         ]
         
         for input_word, expected in test_cases:
-            corrected = matcher.correct_text(input_word)
+            corrected = matcher.normalize(input_word)
             suite.test(
                 f"Correct '{input_word}' → '{expected}'",
                 corrected == expected,
@@ -78,10 +125,18 @@ def test_fuzzy_matcher():
             )
         
         # Test multi-word
-        result = matcher.correct_text("how to make expresso")
+        result = _correct(matcher, "how to make expresso")
         suite.test(
             "Multi-word correction",
-            "espresso" in result,
+            result == "how to make espresso",
+            f"Got: {result}"
+        )
+        
+        # Unlisted misspellings fall back to the closest key
+        result = matcher.fuzzy_match("expreso")
+        suite.test(
+            "Fuzzy match 'expreso' → 'espresso'",
+            result == "espresso",
             f"Got: {result}"
         )
         
@@ -91,13 +146,77 @@ def test_fuzzy_matcher():
     return suite
 
 
+def _levenshtein(a, b):
+    """Reference full-matrix edit distance"""
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        curr = [i]
+        for j, cb in enumerate(b, 1):
+            curr.append(min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = curr
+    return prev[-1]
+
+
+def test_bounded_levenshtein():
+    """Test the banded edit distance and short-word rejection"""
+    suite = TestSuite()
+    suite.section("BOUNDED LEVENSHTEIN TESTS")
+    
+    try:
+        # Fuzz against the reference implementation
+        rng = random.Random(0)
+        mismatches = []
+        for _ in range(20000):
+            a = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 8)))
+            b = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 8)))
+            k = rng.randint(0, 3)
+            expected = min(_levenshtein(a, b), k + 1)
+            got = bounded_levenshtein(np.frombuffer(a.encode(), dtype=np.uint8),
+                                      np.frombuffer(b.encode(), dtype=np.uint8), k)
+            if got != expected:
+                mismatches.append((a, b, k, got, expected))
+        suite.test(
+            "Matches reference on 20000 random pairs",
+            not mismatches,
+            f"First mismatch: {mismatches[:1]}"
+        )
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pronunciations.json')
+            with open(path, 'w') as f:
+                json.dump({"espresso": [], "tea": [], "latte": [], "mocha": []}, f)
+            matcher = FuzzyMatcher(path)
+        
+        # Short words must not snap onto unrelated keys
+        for word in ["a", "to", "me", "the"]:
+            result = matcher.fuzzy_match(word)
+            suite.test(
+                f"Keep short word '{word}'",
+                result == word,
+                f"Got: {result}"
+            )
+        
+        for word, expected in [("expresso", "espresso"), ("lattay", "latte"), ("tee", "tea")]:
+            result = matcher.fuzzy_match(word)
+            suite.test(
+                f"Match '{word}' → '{expected}'",
+                result == expected,
+                f"Got: {result}"
+            )
+        
+    except Exception as e:
+        suite.test("Bounded Levenshtein", False, str(e))
+    
+    return suite
+
+
 def test_topic_filter():
     """Test topic filtering"""
     suite = TestSuite()
     suite.section("TOPIC FILTER TESTS")
     
     try:
-        filter_obj = TopicFilter()
+        filter_obj = _filter()
         
         # Coffee-related queries (should pass)
         coffee_queries = [
@@ -105,31 +224,35 @@ def test_topic_filter():
             "what is the best grind size",
             "cappuccino recipe",
             "milk steaming temperature",
-            "arabica vs robusta"
+            "arabica vs robusta",
+            "I like cold brewing",
+            "brewing tips",
+            "two espressos please",
+            "i love lattes",
+            "best roasts"
         ]
         
         for query in coffee_queries:
-            is_related, conf, reason = filter_obj.is_coffee_related(query)
             suite.test(
                 f"Accept: '{query}'",
-                is_related,
-                f"Confidence: {conf:.2f}, Reason: {reason}"
+                filter_obj.is_coffee_related(query)
             )
         
-        # Non-coffee queries (should fail)
+        # Non-coffee queries (should fail); keywords match whole words up
+        # to a plural or -ing/-ed ending, not arbitrary substrings
         non_coffee_queries = [
             "what is the weather today",
             "who won the game",
             "how to fix my car",
-            "tell me a joke"
+            "tell me a joke",
+            "the milky way",
+            "pressed flowers"
         ]
         
         for query in non_coffee_queries:
-            is_related, conf, reason = filter_obj.is_coffee_related(query)
             suite.test(
                 f"Reject: '{query}'",
-                not is_related,
-                f"Confidence: {conf:.2f}, Reason: {reason}"
+                not filter_obj.is_coffee_related(query)
             )
         
     except Exception as e:
@@ -144,7 +267,7 @@ def test_retrieval_system():
     suite.section("RETRIEVAL SYSTEM TESTS")
     
     try:
-        retrieval = RetrievalSystem()
+        retrieval = _retrieval()
         
         # Test retrieval accuracy
         test_queries = [
@@ -156,32 +279,40 @@ def test_retrieval_system():
         ]
         
         for query, expected_keyword in test_queries:
-            results = retrieval.retrieve(query, top_k=3)
+            answer = retrieval.retrieve(query)
             
-            # Check if we got results
+            # Check if we got a result
             suite.test(
                 f"Retrieve: '{query}'",
-                len(results) > 0,
-                f"Got {len(results)} results"
+                answer is not None,
+                "No answer"
             )
             
             # Check relevance
-            if results:
-                answer = results[0]['answer'].lower()
+            if answer:
                 suite.test(
                     f"Relevant result for '{query}'",
-                    expected_keyword.lower() in answer,
-                    f"Score: {results[0]['relevance_score']:.3f}"
+                    expected_keyword.lower() in answer.lower(),
+                    f"Got: {answer[:60]}"
                 )
         
-        # Test get_answer
-        answer, conf = retrieval.get_answer("how to make espresso")
+        # Nothing above the cutoff
+        answer = retrieval.retrieve("zzz qqq")
         suite.test(
-            "get_answer returns result",
-            len(answer) > 0 and conf > 0,
-            f"Confidence: {conf:.3f}"
+            "No answer below cutoff",
+            answer is None,
+            f"Got: {answer}"
         )
         
+        # Off-topic queries share no content words with any question
+        for query in OFF_TOPIC_QUERIES:
+            answer = retrieval.retrieve(query)
+            suite.test(
+                f"No answer for off-topic '{query}'",
+                answer is None,
+                f"Got: {answer}"
+            )
+        
     except Exception as e:
         suite.test("Retrieval system initialization", False, str(e))
     
@@ -195,9 +326,9 @@ def test_full_pipeline():
     
     try:
         # Initialize components
-        matcher = FuzzyMatcher()
-        topic_filter = TopicFilter()
-        retrieval = RetrievalSystem()
+        matcher = _matcher()
+        topic_filter = _filter()
+        retrieval = _retrieval()
         
         # Test queries through full pipeline
         test_cases = [
@@ -222,29 +353,24 @@ def test_full_pipeline():
             query = case["input"]
             
             # Step 1: Fuzzy matching
-            corrected = matcher.correct_text(query)
+            corrected = _correct(matcher, query)
             
             # Step 2: Topic filtering
-            is_related, conf, reason = topic_filter.is_coffee_related(corrected)
+            is_related = topic_filter.is_coffee_related(corrected)
             
             suite.test(
                 f"Pipeline: '{query}' should {'pass' if case['should_pass'] else 'fail'}",
                 is_related == case["should_pass"],
-                f"Got: {is_related}, Confidence: {conf:.2f}"
+                f"Got: {is_related}, Corrected: {corrected}"
             )
             
             # Step 3: Retrieval (only if passed filter)
             if is_related and case["should_pass"]:
-                results = retrieval.retrieve(corrected, top_k=1)
-                has_keyword = False
-                if results and case["expected_keyword"]:
-                    answer = results[0]['answer'].lower()
-                    has_keyword = case["expected_keyword"].lower() in answer
-                
+                answer = retrieval.retrieve(corrected)
                 suite.test(
                     f"Retrieve relevant answer for '{query}'",
-                    has_keyword,
-                    f"Score: {results[0]['relevance_score']:.3f}" if results else "No results"
+                    answer is not None and case["expected_keyword"] in answer.lower(),
+                    f"Got: {answer[:60]}" if answer else "No answer"
                 )
         
     except Exception as e:
@@ -253,24 +379,113 @@ def test_full_pipeline():
     return suite
 
 
+def test_app_components():
+    """Test the text components of the standalone barista_buddy.py app"""
+    suite = TestSuite()
+    suite.section("APP COMPONENT TESTS")
+    
+    # The app imports its audio libraries at module level; sounddevice raises
+    # OSError rather than ImportError when PortAudio is not installed
+    try:
+        from barista_buddy import FuzzyMatcher as AppFuzzyMatcher
+        from barista_buddy import RetrievalSystem as AppRetrievalSystem
+    except (ImportError, OSError) as e:
+        suite.skip("App components", f"barista_buddy.py could not be imported: {e}")
+        return suite
+    
+    try:
+        # Corrections from the shipped dictionary replace whole words only
+        with open(os.path.join(DATA_DIR, 'pronunciation_dict.json'), encoding='utf-8') as f:
+            matcher = AppFuzzyMatcher(json.load(f))
+        for text, expected in [
+            ("how to make expresso", "how to make espresso"),
+            ("Too LATE for a capuchino", "too latte for a cappuccino"),
+            ("micro foam please", "microfoam please"),
+            ("lateral thinking", "lateral thinking"),
+            ("expressos", "expressos"),
+        ]:
+            result = matcher.correct_text(text)
+            suite.test(
+                f"Correct '{text}' → '{expected}'",
+                result == expected,
+                f"Got: {result}"
+            )
+        
+        with open(os.path.join(DATA_DIR, 'coffee_knowledge.json'), encoding='utf-8') as f:
+            retrieval = AppRetrievalSystem(json.load(f), cutoff=0.6)
+        
+        # Shared tokens narrow the candidates to matching questions
+        results = retrieval.retrieve("how to make espresso")
+        suite.test(
+            "Indexed query ranks exact question first",
+            bool(results) and results[0]["question"] == "how to make espresso",
+            f"Got: {[r['question'] for r in results]}"
+        )
+        
+        # Misheard words only match once the matcher has corrected them
+        results = retrieval.retrieve(matcher.correct_text("expresso"))
+        suite.test(
+            "Corrected query finds indexed question",
+            bool(results) and "espresso" in results[0]["question"],
+            f"Got: {[r['question'] for r in results]}"
+        )
+        
+        for query in OFF_TOPIC_QUERIES:
+            results = retrieval.retrieve(query)
+            suite.test(
+                f"No FAQ hit for off-topic '{query}'",
+                results == [],
+                f"Got: {[r['question'] for r in results]}"
+            )
+        
+        # Cached results are fresh copies
+        retrieval.retrieve("latte art")[0]["answer"] = "changed"
+        suite.test(
+            "Cached results are not shared",
+            retrieval.retrieve("latte art")[0]["answer"] != "changed"
+        )
+        
+    except Exception as e:
+        suite.test("App components", False, str(e))
+    
+    return suite
+
+
+def run_suite(test_func):
+    """Run one test suite, capturing its output for ordered printing"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        suite = test_func()
+    return output.getvalue(), suite.passed, suite.failed, suite.skipped, suite.total
+
+
 def run_all_tests():
     """Run all tests"""
     print("\n" + "="*70)
     print("  BARISTA BUDDY - TEST SUITE")
     print("="*70 + "\n")
     
-    # Run individual test suites
-    suites = [
-        test_fuzzy_matcher(),
-        test_topic_filter(),
-        test_retrieval_system(),
-        test_full_pipeline()
+    # Suites build their own components, so run them in parallel processes
+    test_funcs = [
+        test_fuzzy_matcher,
+        test_bounded_levenshtein,
+        test_topic_filter,
+        test_retrieval_system,
+        test_full_pipeline,
+        test_app_components
     ]
+    processes = max(1, min(len(test_funcs), (os.cpu_count() or 1) - 2))
+    with multiprocessing.Pool(processes=processes) as pool:
+        results = pool.map(run_suite, test_funcs)
+    
+    for output, _, _, _, _ in results:
+        print(output, end="")
     
     # Calculate total
-    total_passed = sum(s.passed for s in suites)
-    total_failed = sum(s.failed for s in suites)
-    total_tests = sum(s.total for s in suites)
+    total_passed = sum(r[1] for r in results)
+    total_failed = sum(r[2] for r in results)
+    total_skipped = sum(r[3] for r in results)
+    total_tests = sum(r[4] for r in results)
     
     # Print overall summary
     print("\n" + "="*70)
@@ -279,6 +494,8 @@ def run_all_tests():
     print(f"  Total Tests:  {total_tests}")
     print(f"  Passed:       {total_passed} ✓")
     print(f"  Failed:       {total_failed} ✗")
+    if total_skipped:
+        print(f"  Skipped:      {total_skipped}")
     print(f"  Success Rate: {(total_passed/total_tests*100):.1f}%")
     print("="*70 + "\n")
     
@@ -1,10 +1,50 @@
-from difflib import get_close_matches
 import json
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def bounded_levenshtein(a, b, k):
+    """Levenshtein distance of two byte arrays, or k + 1 if it exceeds k"""
+    la, lb = len(a), len(b)
+    if abs(la - lb) > k:
+        return k + 1
+
+    # Only cells within k of the diagonal can stay under the bound
+    prev = np.full(lb + 1, k + 1, dtype=np.int64)
+    curr = np.full(lb + 1, k + 1, dtype=np.int64)
+    for j in range(min(lb, k) + 1):
+        prev[j] = j
+
+    for i in range(1, la + 1):
+        lo = max(1, i - k)
+        hi = min(lb, i + k)
+        curr[:] = k + 1
+        if i <= k:
+            curr[0] = i
+        row_min = curr[0]
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d = min(prev[j] + 1, curr[j - 1] + 1, prev[j - 1] + cost)
+            curr[j] = d
+            if d < row_min:
+                row_min = d
+        if row_min > k:
+            return k + 1
+        prev, curr = curr, prev
+
+    return min(prev[lb], k + 1)
 
 class FuzzyMatcher:
-    def __init__(self, pronunciation_file):
+    def __init__(self, pronunciation_file, max_distance=2, cutoff=0.6):
         with open(pronunciation_file, "r") as f:
-            self.pronunciations = json.load(f)
+            data = json.load(f)
+        # The shipped dictionary nests its entries under one top-level key
+        self.pronunciations = data.get("pronunciation_variations", data)
+
+        self.max_distance = max_distance
+        self.cutoff = cutoff
+        self._keys = list(self.pronunciations.keys())
+        self._keys_bytes = [np.frombuffer(k.encode(), dtype=np.uint8) for k in self._keys]
 
     def normalize(self, text):
         for correct, variants in self.pronunciations.items():
@@ -13,6 +53,14 @@ class FuzzyMatcher:
         return text
 
     def fuzzy_match(self, text):
-        keys = list(self.pronunciations.keys())
-        match = get_close_matches(text, keys, n=1, cutoff=0.7)
-        return match[0] if match else text
+        text_bytes = np.frombuffer(text.encode(), dtype=np.uint8)
+        best_key, best_dist = text, self.max_distance + 1
+        for key, key_bytes in zip(self._keys, self._keys_bytes):
+            # Allowed edits scale with word length so short words like "to"
+            # or "the" aren't pulled onto unrelated keys
+            longest = max(len(text_bytes), len(key_bytes))
+            k = min(self.max_distance, int((1 - self.cutoff) * longest))
+            dist = bounded_levenshtein(text_bytes, key_bytes, k)
+            if dist <= k and dist < best_dist:
+                best_key, best_dist = key, dist
+        return best_key
@@ -1,22 +1,49 @@
 import json
-from difflib import SequenceMatcher
+import re
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# Words too common to count as overlap between a query and an FAQ question
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for",
+    "with", "from", "by", "about", "vs", "is", "are", "was", "be", "do", "does",
+    "did", "can", "could", "should", "would", "will", "i", "me", "my", "you",
+    "your", "we", "it", "its", "this", "that", "what", "how", "why", "when",
+    "where", "which", "who", "make", "get", "tell", "help", "please", "want",
+    "like", "know", "some", "any", "too", "no", "not", "much", "many", "best",
+    "good",
+})
 
 class RetrievalSystem:
-    def __init__(self, knowledge_file):
+    def __init__(self, knowledge_file, cutoff=0.6):
         with open(knowledge_file, "r") as f:
             self.knowledge = json.load(f)
 
-    def similarity(self, a, b):
-        return SequenceMatcher(None, a, b).ratio()
+        self.cutoff = cutoff
+        self.questions = [self.preprocess(item["question"]) for item in self.knowledge]
+        self.question_tokens = [set(q.split()) - FILLER_WORDS for q in self.questions]
+
+    def preprocess(self, text):
+        return re.sub(r"[^\w\s]", "", text.lower()).strip()
 
     def retrieve(self, query):
-        best_score = 0
-        best_answer = None
+        query = self.preprocess(query)
+
+        # Only questions sharing a content token with the query are scored,
+        # token_set_ratio alone rates queries like "tell me a joke" too high
+        tokens = set(query.split()) - FILLER_WORDS
+        candidates = [i for i, q_tokens in enumerate(self.question_tokens) if q_tokens & tokens]
+        if not candidates:
+            return None
 
-        for item in self.knowledge:
-            score = self.similarity(query.lower(), item["question"].lower())
-            if score > best_score:
-                best_score = score
-                best_answer = item["answer"]
+        # cdist releases the GIL and spreads scoring across all cores
+        scores = process.cdist([query],
+                               [self.questions[i] for i in candidates],
+                               scorer=fuzz.token_set_ratio,
+                               score_cutoff=self.cutoff * 100,
+                               workers=-1)[0]
+        best = int(np.argmax(scores))
+        if scores[best] < self.cutoff * 100:
+            return None
 
-        return best_answer if best_score > 0.5 else None
+        return self.knowledge[candidates[best]]["answer"]
@@ -1,20 +1,34 @@
 import json
+import queue
 import sounddevice as sd
 from vosk import Model, KaldiRecognizer
 
 class STTHandler:
-    def __init__(self, model_path, samplerate=16000):
+    def __init__(self, model_path, samplerate=16000, blocksize=4000):
         self.model = Model(model_path)
         self.recognizer = KaldiRecognizer(self.model, samplerate)
         self.samplerate = samplerate
+        self.blocksize = blocksize
 
     def listen(self, duration=5):
-        audio = sd.rec(int(duration * self.samplerate),
-                        samplerate=self.samplerate,
-                        channels=1,
-                        dtype='int16')
-        sd.wait()
+        audio_queue = queue.Queue()
 
-        self.recognizer.AcceptWaveform(audio.tobytes())
-        result = json.loads(self.recognizer.Result())
+        def callback(indata, frames, time, status):
+            audio_queue.put(bytes(indata))
+
+        # Decode blocks as they arrive and stop at the end of the utterance;
+        # duration is only an upper bound on how long to listen
+        max_blocks = int(duration * self.samplerate / self.blocksize)
+        with sd.RawInputStream(samplerate=self.samplerate,
+                               blocksize=self.blocksize,
+                               dtype='int16',
+                               channels=1,
+                               callback=callback):
+            for _ in range(max_blocks):
+                data = audio_queue.get()
+                if self.recognizer.AcceptWaveform(data):
+                    result = json.loads(self.recognizer.Result())
+                    return result.get("text", "")
+
+        result = json.loads(self.recognizer.FinalResult())
         return result.get("text", "")
@@ -1,8 +1,39 @@
+import re
+import ahocorasick
+
+def stem(word):
+    """Strip common suffixes so 'lattes' and 'brewing' match 'latte' and 'brew'"""
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
 class TopicFilter:
     def __init__(self, keyword_file):
         with open(keyword_file, "r") as f:
             self.keywords = [k.strip() for k in f.readlines()]
 
+        # Keywords and text are stemmed the same way; single words are
+        # matched by token lookup, phrases by the automaton on whole words
+        words = [self.normalize(k) for k in self.keywords if k and " " not in k]
+        self._kwset = frozenset(words)
+
+        self.automaton = ahocorasick.Automaton()
+        for keyword in self.keywords:
+            if " " in keyword:
+                self.automaton.add_word(f" {self.normalize(keyword)} ", keyword)
+        self.automaton.make_automaton()
+
+    def normalize(self, text):
+        return " ".join(stem(t) for t in re.findall(r"[a-z0-9']+", text.lower()))
+
     def is_coffee_related(self, text):
-        text = text.lower()
-        return any(keyword in text for keyword in self.keywords)
+        stems = self.normalize(text)
+        if not self._kwset.isdisjoint(stems.split()):
+            return True
+        if len(self.automaton) == 0:
+            return False
+        return next(self.automaton.iter(f" {stems} "), None) is not None
@@ -7,13 +7,19 @@ Barista Buddy - Voice-Only AI Voice Assistant with Continuous Listening
 - Stop words: exit, goodbye, good bye
 """
 
+import copy
 import json
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import difflib
 import pyttsx3
 import speech_recognition as sr
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
+import sounddevice as sd
+from scipy.io import wavfile
+import numpy as np
+from rapidfuzz import fuzz, process
 import re
 
 # ---------------------------
@@ -23,11 +29,18 @@ class STTHandler:
     def __init__(self):
         self.recognizer = sr.Recognizer()
         self.microphone = sr.Microphone()
+        # Calibrate once and keep the threshold fixed for every turn
+        self.recognizer.dynamic_energy_threshold = False
+        self.recalibrate()
+
+    def recalibrate(self, duration=1.0):
+        """Re-measure ambient noise and update the energy threshold"""
+        with self.microphone as source:
+            self.recognizer.adjust_for_ambient_noise(source, duration=duration)
 
     def listen_once(self, timeout=5, phrase_time_limit=6) -> str:
         """Listen once and return recognized text"""
         with self.microphone as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=0.3)
             try:
                 audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
                 return self.recognizer.recognize_google(audio).lower()
@@ -42,9 +55,34 @@ class TTSHandler:
         self.engine = pyttsx3.init()
         self.engine.setProperty("rate", rate)
         self.engine.setProperty("volume", 1.0)
+        self._cache = {}
+
+    def precache(self, phrases):
+        """Synthesize fixed phrases to audio once so speak() can replay them"""
+        for phrase in phrases:
+            if phrase in self._cache:
+                continue
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            try:
+                self.engine.save_to_file(phrase, path)
+                self.engine.runAndWait()
+                self._cache[phrase] = wavfile.read(path)
+            except Exception as e:
+                # Some drivers can't render to WAV (e.g. macOS writes AIFF);
+                # speak() then falls back to live TTS for this phrase
+                print(f"⚠️ Could not precache phrase {phrase!r}: {e}")
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
 
     def speak(self, text):
         print(f"\n🤖 Barista Buddy: {text}\n")
+        if text in self._cache:
+            samplerate, audio = self._cache[text]
+            sd.play(audio, samplerate)
+            sd.wait()
+            return
         self.engine.say(text)
         self.engine.runAndWait()
 
@@ -52,17 +90,42 @@ class TTSHandler:
 # FUZZY MATCHER
 # ---------------------------
 class FuzzyMatcher:
-    def __init__(self, pronunciation_dict):
+    def __init__(self, pronunciation_dict, cache_size=512):
         self.pronunciation_dict = pronunciation_dict
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+        # Compile every correction into one alternation so the input is
+        # scanned once; longest keys first so they win over their prefixes
+        # The dictionary maps each correct term to its misheard variants,
+        # nested under "pronunciation_variations" in the shipped file
+        variations = pronunciation_dict.get("pronunciation_variations", pronunciation_dict)
+        self._map = {}
+        for correct, variants in variations.items():
+            if isinstance(variants, str):
+                variants = [variants]
+            for wrong in variants:
+                if wrong.lower() != correct.lower():
+                    self._map.setdefault(wrong.lower(), correct.lower())
+        keys = sorted(self._map, key=len, reverse=True)
+        self._pat = re.compile(
+            r"\b(" + "|".join(re.escape(k) for k in keys) + r")\b", re.IGNORECASE
+        ) if keys else None
 
     def correct_text(self, text: str) -> str:
         text = text.lower()
-        for wrong, correct in self.pronunciation_dict.items():
-            if isinstance(correct, list):
-                correct = correct[0]
-            if isinstance(correct, str):
-                text = text.replace(wrong.lower(), correct.lower())
-        return text
+        if text in self._cache:
+            self._cache.move_to_end(text)
+            return self._cache[text]
+
+        corrected = text
+        if self._pat is not None:
+            corrected = self._pat.sub(lambda m: self._map[m.group(0).lower()], text)
+
+        self._cache[text] = corrected
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return corrected
 
 # ---------------------------
 # TOPIC FILTER
@@ -78,91 +141,248 @@ class TopicFilter:
 # ---------------------------
 # RETRIEVAL SYSTEM
 # ---------------------------
+# Words too common to count as overlap between a query and an FAQ question
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for",
+    "with", "from", "by", "about", "vs", "is", "are", "was", "be", "do", "does",
+    "did", "can", "could", "should", "would", "will", "i", "me", "my", "you",
+    "your", "we", "it", "its", "this", "that", "what", "how", "why", "when",
+    "where", "which", "who", "make", "get", "tell", "help", "please", "want",
+    "like", "know", "some", "any", "too", "no", "not", "much", "many", "best",
+    "good",
+})
+
 class RetrievalSystem:
-    def __init__(self, knowledge_list, cutoff=0.6):
+    def __init__(self, knowledge_list, cutoff=0.6, cache_size=256):
         self.knowledge_dict = {}
         self.cutoff = cutoff
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
         for item in knowledge_list:
             question = item.get("question", "").lower()
             answer = item.get("answer", "")
             if question and answer:
                 self.knowledge_dict[question] = answer
 
+        # Precompute the match corpus once instead of on every query, as
+        # parallel arrays of preprocessed questions and their answers
+        self.knowledge_keys = list(self.knowledge_dict.keys())
+        self.questions = np.array([self._preprocess(k) for k in self.knowledge_keys], dtype=object)
+        self.answers = [self.knowledge_dict[k] for k in self.knowledge_keys]
+
+        # Inverted index content token -> question indices; only questions
+        # sharing a content token with the query are scored at all
+        self._inverted = {}
+        for i, key in enumerate(self.questions):
+            for token in set(key.split()) - FILLER_WORDS:
+                self._inverted.setdefault(token, []).append(i)
+
+    @staticmethod
+    def _preprocess(text: str) -> str:
+        """Lowercase and strip punctuation before fuzzy scoring"""
+        return re.sub(r"[^\w\s]", "", text.lower()).strip()
+
     def retrieve(self, query, top_k=3):
-        query = query.lower()
-        keys = list(self.knowledge_dict.keys())
-        matches = difflib.get_close_matches(query, keys, n=top_k, cutoff=self.cutoff)
-        return [{"question": k, "answer": self.knowledge_dict[k]} for k in matches]
+        query = self._preprocess(query)
+        cache_key = (query, top_k)
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            return self._results(self._cache[cache_key])
+
+        # token_set_ratio alone scores off-topic queries like "tell me a
+        # joke" above the cutoff, so a shared content token is required
+        candidates = set()
+        for token in set(query.split()) - FILLER_WORDS:
+            candidates.update(self._inverted.get(token, ()))
+        candidates = np.array(sorted(candidates), dtype=int)
+
+        # score_cutoff lets RapidFuzz bail out of hopeless candidates early;
+        # a length prefilter is not safe here since token_set_ratio scores
+        # a question containing every query token as 100 whatever its length
+        scores = process.cdist(
+            [query],
+            self.questions[candidates],
+            scorer=fuzz.token_set_ratio,
+            score_cutoff=self.cutoff * 100,
+            workers=-1,
+        )[0]
+
+        # Order by score, then corpus index, so ties rank deterministically
+        top = np.lexsort((candidates, -scores))[:top_k]
+        top = top[scores[top] >= self.cutoff * 100]
+        # Cache corpus indices only, so callers always get fresh dicts
+        indices = tuple(int(i) for i in candidates[top])
+
+        self._cache[cache_key] = indices
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return self._results(indices)
+
+    def _results(self, indices):
+        return [{"question": self.knowledge_keys[i], "answer": self.answers[i]} for i in indices]
 
 # ---------------------------
 # LLM HANDLER
 # ---------------------------
 class LLMHandler:
-    def __init__(self, model_name="distilgpt2"):
+    PROMPT_PREFIX = (
+        "You are Barista Buddy, a coffee-only assistant. "
+        "Only answer questions related to coffee. "
+        "If the question is not about coffee, say: 'Sorry, I can only answer coffee questions.'\n\n"
+    )
+
+    def __init__(self, model_name="distilgpt2", model_path=None, greedy=True, max_new_tokens=80,
+                 compile_model=False):
         print("Loading LLM model...")
+        self.greedy = greedy
+        self.max_new_tokens = max_new_tokens
+        self.llm = None
+        if model_path:
+            # Quantized GGUF model through llama.cpp, no torch needed
+            from llama_cpp import Llama
+            self.llm = Llama(model_path=str(model_path), n_threads=os.cpu_count(), verbose=False)
+            print("LLM ready!")
+            return
+
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteriaList
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForCausalLM.from_pretrained(model_name)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model.to(self.device)
+        if self.device.type == "cuda":
+            # FP16 weights and TF32 matmuls on GPU
+            torch.backends.cuda.matmul.allow_tf32 = True
+            self.model.half()
         self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        # Encode the static prompt prefix once and keep its KV cache so each
+        # query only has to prefill the user-specific suffix
+        self._prefix_ids = self.tokenizer.encode(self.PROMPT_PREFIX, return_tensors="pt").to(self.device)
+        if compile_model and self.device.type == "cuda":
+            self._compile_forward(torch)
+        with torch.no_grad():
+            self._prefix_kv = self.model(self._prefix_ids, use_cache=True).past_key_values
+        self._stopping_criteria = StoppingCriteriaList([self._stop_on_user_turn])
         print("LLM ready!")
 
+    def _compile_forward(self, torch):
+        """Compile model.forward, staying in eager mode if torch.compile fails"""
+        # Compiling forward rather than the module keeps generate() on the
+        # compiled path; the warmup call surfaces backend errors here
+        eager_forward = self.model.forward
+        try:
+            self.model.forward = torch.compile(eager_forward, dynamic=True)
+            with torch.no_grad():
+                self.model(self._prefix_ids)
+        except RuntimeError as e:
+            print(f"torch.compile unavailable, using eager mode: {e}")
+            self.model.forward = eager_forward
+
+    def _stop_on_user_turn(self, input_ids, scores, **kwargs):
+        """Stop generating once the model starts writing the next user turn"""
+        import torch
+        tails = self.tokenizer.batch_decode(input_ids[:, -4:])
+        return torch.tensor(["\nUser:" in t for t in tails], device=input_ids.device)
+
     def query(self, text: str) -> str:
-        prompt = (
-            "You are Barista Buddy, a coffee-only assistant. "
-            "Only answer questions related to coffee. "
-            "If the question is not about coffee, say: 'Sorry, I can only answer coffee questions.'\n\n"
-            f"User: {text}\nBarista Buddy:"
-        )
-        inputs = self.tokenizer.encode(prompt, return_tensors="pt").to(self.device)
+        suffix = f"User: {text}\nBarista Buddy:"
+        if self.llm is not None:
+            output = self.llm(
+                self.PROMPT_PREFIX + suffix,
+                max_tokens=self.max_new_tokens,
+                temperature=0.0 if self.greedy else 0.7,
+                stop=["\nUser:"],
+            )
+            return output["choices"][0]["text"].strip()
+
+        import torch
+        if self.greedy:
+            sampling = {"do_sample": False, "num_beams": 1}
+        else:
+            sampling = {"do_sample": True, "temperature": 0.7}
+        suffix_ids = self.tokenizer.encode(suffix, return_tensors="pt").to(self.device)
+        inputs = torch.cat([self._prefix_ids, suffix_ids], dim=-1)
         outputs = self.model.generate(
             inputs,
-            max_length=200,
+            attention_mask=torch.ones_like(inputs),
+            past_key_values=copy.deepcopy(self._prefix_kv),
+            max_new_tokens=self.max_new_tokens,
             num_return_sequences=1,
             pad_token_id=self.tokenizer.eos_token_id,
-            do_sample=True,
-            temperature=0.7
+            use_cache=True,
+            stopping_criteria=self._stopping_criteria,
+            **sampling
         )
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return response.split("Barista Buddy:")[-1].strip()
+        response = self.tokenizer.decode(outputs[0][inputs.shape[-1]:], skip_special_tokens=True)
+        return response.split("\nUser:")[0].strip()
 
 # ---------------------------
 # BARISTA BUDDY MAIN APP
 # ---------------------------
 class BaristaBuddy:
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, llm_model_path=None):
         print("\n☕ BARISTA BUDDY (Continuous Listening Mode)")
         print("=" * 60)
 
         base_dir = Path(data_dir)
 
-        # Load datasets
-        with open(base_dir / "coffee_keywords.txt", encoding="utf-8") as f:
-            keywords = [l.strip().lower() for l in f if l.strip()]
-
-        with open(base_dir / "coffee_knowledge.json", encoding="utf-8") as f:
-            knowledge_list = json.load(f)
-
-        with open(base_dir / "pronunciation_dict.json", encoding="utf-8") as f:
-            pronunciation = json.load(f)
+        # All pyttsx3 calls run on one worker thread; the TTS engine and its
+        # phrase cache are built there while the rest of the app loads
+        self._tts_executor = ThreadPoolExecutor(max_workers=1)
+        tts_ready = self._tts_executor.submit(self._load_tts)
 
         # Initialize components
         self.stt = STTHandler()
-        self.tts = TTSHandler(rate=180)
-        self.fuzzy_matcher = FuzzyMatcher(pronunciation)
-        self.topic_filter = TopicFilter(keywords)
-        self.retrieval = RetrievalSystem(knowledge_list, cutoff=0.5)
-        self.llm = LLMHandler(model_name="distilgpt2")
+        self.fuzzy_matcher, self.topic_filter, self.retrieval = self._build_components(base_dir)
+        # LLM is loaded on the first FAQ miss, most queries never need it
+        self.llm = None
+        self.llm_model_path = llm_model_path
 
         # Stop words
         self.stop_words = ["exit", "goodbye", "good bye"]
 
+        self.tts = tts_ready.result()
+
         print("✓ Voice input enabled")
         print("✓ Voice output enabled")
         print("✓ FAQ-first fallback enabled")
         print("✓ Continuous listening enabled")
         print("=" * 60 + "\n")
 
+    @staticmethod
+    def _build_components(base_dir):
+        """Load the datasets and build the text-processing components"""
+        with open(base_dir / "coffee_keywords.txt", encoding="utf-8") as f:
+            keywords = [l.strip().lower() for l in f if l.strip()]
+
+        with open(base_dir / "coffee_knowledge.json", encoding="utf-8") as f:
+            knowledge_list = json.load(f)
+
+        with open(base_dir / "pronunciation_dict.json", encoding="utf-8") as f:
+            pronunciation = json.load(f)
+
+        return (
+            FuzzyMatcher(pronunciation),
+            TopicFilter(keywords),
+            RetrievalSystem(knowledge_list, cutoff=0.6),
+        )
+
+    def _load_tts(self):
+        tts = TTSHandler(rate=180)
+        # Fixed replies are synthesized once and replayed from memory
+        tts.precache([
+            "Barista Buddy is ready and listening.",
+            "Goodbye! Happy brewing!",
+            "Exiting Barista Buddy. Goodbye!",
+            "Sorry, I can only help with coffee-related questions.",
+        ])
+        return tts
+
+    def speak_async(self, text):
+        """Queue text on the TTS thread and return its Future"""
+        return self._tts_executor.submit(self.tts.speak, text)
+
     # ---------------------------
     # PROCESS QUERY (FAQ-first)
     # ---------------------------
@@ -177,6 +397,8 @@ class BaristaBuddy:
 
         # Step 2: LLM fallback if coffee-related
         if self.topic_filter.is_coffee_related(query):
+            if self.llm is None:
+                self.llm = LLMHandler(model_name="distilgpt2", model_path=self.llm_model_path)
             answer = self.llm.query(query)
             if answer:
                 return answer
@@ -188,24 +410,28 @@ class BaristaBuddy:
     # RUN CONTINUOUS MODE
     # ---------------------------
     def run_continuous_mode(self):
-        self.tts.speak("Barista Buddy is ready and listening.")
+        speaking = self.speak_async("Barista Buddy is ready and listening.")
         try:
             while True:
+                # Don't open the microphone while we are still talking
+                speaking.result()
                 query = self.stt.listen_once()
                 if not query.strip():
                     continue
 
                 # Stop words check
                 if any(stop in query for stop in self.stop_words):
-                    self.tts.speak("Goodbye! Happy brewing!")
+                    self.speak_async("Goodbye! Happy brewing!").result()
                     break
 
                 # Assistant responds to any query
                 answer = self.process_query(query)
-                self.tts.speak(answer)
+                speaking = self.speak_async(answer)
 
         except KeyboardInterrupt:
-            self.tts.speak("Exiting Barista Buddy. Goodbye!")
+            self.speak_async("Exiting Barista Buddy. Goodbye!").result()
+        finally:
+            self._tts_executor.shutdown()
 
 # ---------------------------
 # ENTRY POINT